@@ -1,7 +1,6 @@
 import numpy as np
-from scipy.integrate import cumtrapz
 from .common import __get_direction, __get_path
-from thermo.math.correlate import corr
+from thermo.math.correlate import corr_batch
 from scipy import integrate
 
 __author__ = "Alexander Gabourie"
@@ -30,8 +29,32 @@ def __scale_gpumd_tc(vol, T):
     return one * two * three / (T * T * vol)
 
 
+def __uniform_cumtrapz(y, dx):
+    """
+    Cumulative trapezoidal integration along the last axis for uniformly spaced samples. Same as
+    scipy.integrate.cumulative_trapezoid with initial=0, but done with one sum and one cumulative sum.
+
+    Args:
+        y (ndarray):
+            Values to integrate
+
+        dx (float):
+            Spacing between samples
+
+    Returns:
+        ndarray: Cumulative integral with the same shape as y, starting at zero
+    """
+    out = np.empty(y.shape)
+    out[..., 0] = 0
+    np.add(y[..., :-1], y[..., 1:], out=out[..., 1:])
+    np.cumsum(out[..., 1:], axis=-1, out=out[..., 1:])
+    out[..., 1:] *= 0.5 * dx
+    return out
+
+
 def get_gkma_kappa(data, nbins, nsamples, dt, sample_interval, T=300, vol=1, max_tau=None, directions='xyz',
-                   outputfile='heatmode.npy', save=False, directory=None, return_data=True):
+                   outputfile='heatmode.npy', save=False, directory=None, return_data=True, dtype=np.float64,
+                   backend='numpy'):
     """
     Calculate the Green-Kubo thermal conductivity from modal heat current data from 'load_heatmode'
 
@@ -78,6 +101,14 @@ def get_gkma_kappa(data, nbins, nsamples, dt, sample_interval, T=300, vol=1, max
             Toggle returning the loaded modal heat flux data. If this is False, the user should ensure that
             save is True
 
+        dtype (type):
+            Floating point precision used for the correlations. Heat fluxes from 'load_heatmode' are float32, which
+            can be used directly to halve memory use at the cost of precision
+
+        backend (str):
+            FFT backend for the correlations, either 'numpy' (host) or 'cupy' (GPU). The 'cupy' backend requires CuPy
+            and is much faster for large nsamples
+
     Returns:
         dict: Input data dict but with correlation, thermal conductivity, and lag time data included
 
@@ -107,61 +138,47 @@ def get_gkma_kappa(data, nbins, nsamples, dt, sample_interval, T=300, vol=1, max
         max_tau = max_tau * 1e6  # [fs]
 
     max_lag = int(np.floor(max_tau / srate))
-    size = max_lag + 1
-    data['tau'] = np.squeeze(np.linspace(0, max_lag * srate, max_lag + 1))  # [ns]
+    data['tau'] = np.linspace(0, max_lag * srate, max_lag + 1)  # [ns]
 
     ### AUTOCORRELATION ###
     directions = __get_direction(directions)
-    cplx = np.complex128
-    # Note: loops necessary due to memory constraints
+    # Note: all bins of a direction are correlated with one batched FFT, but
+    #  directions are still processed separately due to memory constraints
     #  (can easily max out cluster mem.)
     if 'x' in directions:
         if 'jmxi' not in data.keys() or 'jmxo' not in data.keys():
             raise ValueError("x direction data is missing")
 
-        jx = np.sum(data['jmxi']+data['jmxo'], axis=0)
-        data['jmxijx'] = np.zeros((nbins, size))
-        data['jmxojx'] = np.zeros((nbins, size))
-        data['kmxi'] = np.zeros((nbins, size))
-        data['kmxo'] = np.zeros((nbins, size))
-        for m in range(nbins):
-            data['jmxijx'][m, :] = corr(data['jmxi'][m, :].astype(cplx), jx.astype(cplx), max_lag)
-            data['kmxi'][m, :] = integrate.cumtrapz(data['jmxijx'][m, :], data['tau'], initial=0) * scale
-
-            data['jmxojx'][m, :] = corr(data['jmxo'][m, :].astype(cplx), jx.astype(cplx), max_lag)
-            data['kmxo'][m, :] = integrate.cumtrapz(data['jmxojx'][m, :], data['tau'], initial=0) * scale
+        jx = np.sum(data['jmxi'], axis=0, dtype=dtype)
+        jx += np.sum(data['jmxo'], axis=0, dtype=dtype)
+        data['jmxijx'], data['jmxojx'] = corr_batch([data['jmxi'], data['jmxo']], jx, max_lag,
+                                                       backend, dtype)
+        data['kmxi'] = __uniform_cumtrapz(data['jmxijx'], srate * scale)
+        data['kmxo'] = __uniform_cumtrapz(data['jmxojx'], srate * scale)
         del jx
 
     if 'y' in directions:
         if 'jmyi' not in data.keys() or 'jmyo' not in data.keys():
             raise ValueError("y direction data is missing")
 
-        jy = np.sum(data['jmyi']+data['jmyo'], axis=0)
-        data['jmyijy'] = np.zeros((nbins, size))
-        data['jmyojy'] = np.zeros((nbins, size))
-        data['kmyi'] = np.zeros((nbins, size))
-        data['kmyo'] = np.zeros((nbins, size))
-        for m in range(nbins):
-            data['jmyijy'][m, :] = corr(data['jmyi'][m, :].astype(cplx), jy.astype(cplx), max_lag)
-            data['kmyi'][m, :] = integrate.cumtrapz(data['jmyijy'][m, :], data['tau'], initial=0) * scale
-
-            data['jmyojy'][m, :] = corr(data['jmyo'][m, :].astype(cplx), jy.astype(cplx), max_lag)
-            data['kmyo'][m, :] = integrate.cumtrapz(data['jmyojy'][m, :], data['tau'], initial=0) * scale
+        jy = np.sum(data['jmyi'], axis=0, dtype=dtype)
+        jy += np.sum(data['jmyo'], axis=0, dtype=dtype)
+        data['jmyijy'], data['jmyojy'] = corr_batch([data['jmyi'], data['jmyo']], jy, max_lag,
+                                                       backend, dtype)
+        data['kmyi'] = __uniform_cumtrapz(data['jmyijy'], srate * scale)
+        data['kmyo'] = __uniform_cumtrapz(data['jmyojy'], srate * scale)
         del jy
 
     if 'z' in directions:
         if 'jmz' not in data.keys():
             raise ValueError("z direction data is missing")
 
-        jz = np.sum(data['jmz'], axis=0)
-        data['jmzjz'] = np.zeros((nbins, size))
-        data['kmz'] = np.zeros((nbins, size))
-        for m in range(nbins):
-            data['jmzjz'][m, :] = corr(data['jmz'][m, :].astype(cplx), jz.astype(cplx), max_lag)
-            data['kmz'][m, :] = integrate.cumtrapz(data['jmzjz'][m, :], data['tau'], initial=0) * scale
+        jz = np.sum(data['jmz'], axis=0, dtype=dtype)
+        data['jmzjz'] = corr_batch(data['jmz'], jz, max_lag, backend, dtype)
+        data['kmz'] = __uniform_cumtrapz(data['jmzjz'], srate * scale)
         del jz
 
-    data['tau'] = data['tau'] / 1.e6
+    data['tau'] /= 1.e6
 
     if save:
         np.save(out_path, data)
@@ -180,9 +197,11 @@ def running_ave(kappa, time):
         time (ndarray): Time vector that kappa was sampled at
 
     Returns:
-        ndarray: Running average of kappa input
+        ndarray: Running average of kappa input. Zero where time is zero
     """
-    return cumtrapz(kappa, time, initial=0)/time
+    out = integrate.cumulative_trapezoid(kappa, time, initial=0)
+    np.divide(out, time, out=out, where=time != 0)
+    return out
 
 
 def hnemd_spectral_kappa(shc, Fe, T, V):
@@ -217,6 +236,6 @@ def hnemd_spectral_kappa(shc, Fe, T, V):
         raise ValueError("shc argument must be from load_shc and contain in/out heat currents.")
 
     # ev*A/ps/THz * 1/A^3 *1/K * A ==> W/m/K/THz
-    convert = 1602.17662
-    shc['kwi'] = shc['jwi']*convert/(Fe*T*V)
-    shc['kwo'] = shc['jwo'] * convert / (Fe * T * V)
+    convert = 1602.17662 / (Fe * T * V)
+    shc['kwi'] = shc['jwi'] * convert
+    shc['kwo'] = shc['jwo'] * convert
@@ -135,26 +135,27 @@ def __modal_analysis_read(nbins, nsamples, datapath,
 
         func = partial(__process_sample, nbins)
         pool = mp.Pool(ncore)
-        data = np.array(pool.map(func, range(nsamples)), dtype='float32').transpose((1, 0, 2))
+        data = np.array(pool.map(func, range(nsamples)), dtype='float32').transpose((2, 1, 0))
+        data = np.ascontiguousarray(data)
         pool.close()
 
     else:  # Faster if single thread
-        data = np.zeros((nbins, nsamples, 5), dtype='float32')
+        data = np.zeros((5, nbins, nsamples), dtype='float32')
         for j in range(nsamples):
             for i in range(nbins):
                 measurements = malines.popleft().split()
-                data[i, j, 0] = float(measurements[0])
-                data[i, j, 1] = float(measurements[1])
-                data[i, j, 2] = float(measurements[2])
-                data[i, j, 3] = float(measurements[3])
-                data[i, j, 4] = float(measurements[4])
+                data[0, i, j] = float(measurements[0])
+                data[1, i, j] = float(measurements[1])
+                data[2, i, j] = float(measurements[2])
+                data[3, i, j] = float(measurements[3])
+                data[4, i, j] = float(measurements[4])
 
     del malines
     if ndiv:
-        nbins = int(np.ceil(data.shape[0] / ndiv))  # overwrite nbins
-        npad = nbins * ndiv - data.shape[0]
-        data = np.pad(data, [(0, npad), (0, 0), (0, 0)])
-        data = np.sum(data.reshape((-1, ndiv, data.shape[1], data.shape[2])), axis=1)
+        nbins = int(np.ceil(data.shape[1] / ndiv))  # overwrite nbins
+        npad = nbins * ndiv - data.shape[1]
+        data = np.pad(data, [(0, 0), (0, npad), (0, 0)])
+        data = np.sum(data.reshape((data.shape[0], -1, ndiv, data.shape[2])), axis=2)
 
     return data
 
@@ -419,13 +420,13 @@ def load_heatmode(nbins, nsamples, directory=None,
     out = dict()
     directions = __get_direction(directions)
     if 'x' in directions:
-        out['jmxi'] = data[:, :, 0]
-        out['jmxo'] = data[:, :, 1]
+        out['jmxi'] = data[0]
+        out['jmxo'] = data[1]
     if 'y' in directions:
-        out['jmyi'] = data[:, :, 2]
-        out['jmyo'] = data[:, :, 3]
+        out['jmyi'] = data[2]
+        out['jmyo'] = data[3]
     if 'z' in directions:
-        out['jmz'] = data[:, :, 4]
+        out['jmz'] = data[4]
 
     out['nbins'] = nbins
     out['nsamples'] = nsamples
@@ -508,13 +509,13 @@ def load_kappamode(nbins, nsamples, directory=None,
     out = dict()
     directions = __get_direction(directions)
     if 'x' in directions:
-        out['kmxi'] = data[:, :, 0]
-        out['kmxo'] = data[:, :, 1]
+        out['kmxi'] = data[0]
+        out['kmxo'] = data[1]
     if 'y' in directions:
-        out['kmyi'] = data[:, :, 2]
-        out['kmyo'] = data[:, :, 3]
+        out['kmyi'] = data[2]
+        out['kmyo'] = data[3]
     if 'z' in directions:
-        out['kmz'] = data[:, :, 4]
+        out['kmz'] = data[4]
 
     out['nbins'] = nbins
     out['nsamples'] = nsamples
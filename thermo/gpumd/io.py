@@ -1,7 +1,9 @@
 from ase.io import write
 from ase.io import read
-from ase import Atom, Atoms
+from ase import Atoms
+from ase.symbols import symbols2numbers
 import numpy as np
+import pandas as pd
 import sys
 
 __author__ = "Alexander Gabourie"
@@ -12,65 +14,64 @@ __email__ = "gabourie@stanford.edu"
 #########################################
 
 
-def __get_atom_line(atom, velocity, groups, type_dict, info):
+def __set_atoms(atoms, types):
     """
-    Constructs an atom's line in an xyz.in file.
+    Sets the atom symbols for atoms loaded from GPUMD where in.xyz does not
+    contain that information
 
     Args:
-        atom (ase.Atom):
-            Atom object to write to file.
+        atoms (ase.Atoms):
+            Atoms object to change symbols in
 
-        velocity (bool):
-            If velocities need to be added.
+        types (list(str)):
+            List of strings to assign to atomic symbols
+
+    """
+    atoms.set_chemical_symbols([types[number] for number in atoms.numbers])
 
-        groups (bool):
-            If the groups need to be added.
 
-        type_dict (dict):
-            Dictionary to convert symbol to type number.
+def __get_rank(order):
+    """
+    Maps each entry of a sorting order to its position so that sort keys are
+    found with a single lookup instead of a search through the order.
 
-        info (dict):
-            Dictionary that stores all velocity, and groups data.
+    Args:
+        order (list):
+            A list of entries in the desired order.
 
     Returns:
-        str:
-            The line to be printed to file.
+        dict: Position of the first occurrence of each entry in order
+
     """
-    optional = ''
-    if info:
-        try:
-            option = info[atom.index]
-            if velocity:
-                optional += ' ' + ' '.join([str(val) for val in option['velocity']])
-            if groups:
-                optional += ' ' + ' '.join([str(val) for val in option['groups']])
-        except KeyError:
-            pass
-    required = ' '.join([str(type_dict[atom.symbol])] + \
-                    [str(val) for val in list(atom.position)] + \
-                    [str(atom.mass)])
-
-    return required + optional
+    rank = dict()
+    for i, entry in enumerate(order):
+        rank.setdefault(entry, i)
+    return rank
 
 
-def __set_atoms(atoms, types):
+def __count_lines(filename):
     """
-    Sets the atom symbols for atoms loaded from GPUMD where in.xyz does not
-    contain that information
+    Counts the lines in a file the same way as readlines, but reading the
+    file in binary chunks.
 
     Args:
-        atoms (ase.Atoms):
-            Atoms object to change symbols in
+        filename (str):
+            Name of the file.
 
-        types (list(str)):
-            List of strings to assign to atomic symbols
+    Returns:
+        int: Number of lines in the file.
 
     """
-    for atom in atoms:
-        atom.symbol = types[atom.number]
+    num_lines = 0
+    last = b'\n'
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            num_lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    return num_lines + (last != b'\n')
 
 
-def __atom_type_sortkey(atom, order=None):
+def __atom_type_sortkey(atom, rank=None):
     """
     Used as a key for sorting atom type for GPUMD in.xyz files
 
@@ -78,19 +79,17 @@ def __atom_type_sortkey(atom, order=None):
         atom (ase.Atom):
             Atom object
 
-        order (list(str)):
-            A list of atomic symbol strings in the desired order.
+        rank (dict):
+            Position of each atomic symbol in the desired order, from __get_rank.
 
     """
-    if order:
-        for i, sym in enumerate(order):
-            if sym == atom.symbol:
-                return i
+    if rank:
+        return rank.get(atom.symbol)
     else:
         ValueError('type sortkey error: Missing order.')
 
 
-def __atom_group_sortkey(atom, info=None, group_index=None, order=None):
+def __atom_group_sortkey(atom, groups=None, rank=None):
     """
     Used as a key for sorting atom groups for GPUMD in.xyz files
 
@@ -98,35 +97,28 @@ def __atom_group_sortkey(atom, info=None, group_index=None, order=None):
         atom (ase.Atom):
             Atom object
 
-        info (dict):
-            Info dictionary for Atoms object that 'atom' belongs to. Stores velocity,
-            groups information
+        groups (ndarray):
+            Group of every atom in the grouping selected for sorting, indexed by
+            atom index.
 
-        group_index (int):
-            Index of the grouping list that is part of the 'groups' key for the atom.index
-            element from the info dictionary.
-
-        order (list(int)):
-            A list of ints in desired order for groups at group_index
+        rank (dict):
+            Position of each group in the desired order, from __get_rank.
 
     """
-    if not (info and not group_index is None):
-        ValueError('group sortkey error: Missing either info or group_index.')
+    if groups is None:
+        ValueError('group sortkey error: Missing groups.')
 
-    if order:
-        for i, group in enumerate(order):
-            if group == info[atom.index]['groups'][group_index]:
-                return i
+    if rank:
+        return rank.get(groups[atom.index], sys.maxsize)
     else:
-        return info[atom.index]['groups'][group_index]
-    return sys.maxsize
+        return groups[atom.index]
 
 #########################################
 # Read Related
 #########################################
 
 
-def load_xyz(filename='xyz.in', atom_types=None):
+def load_xyz(filename='xyz.in', atom_types=None, legacy_info=True):
     """
     Reads and returns the structure input file from GPUMD.
 
@@ -137,13 +129,20 @@ def load_xyz(filename='xyz.in', atom_types=None):
         atom_types (list(str)):
             List of atom types (elements).
 
+        legacy_info (bool):
+            Also store velocities and groups per atom in the info dictionary.
+            Turn off to save memory for large structures. thermo.gpumd.preproc
+            and ase_atoms_to_gpumd handle both layouts.
+
     Returns:
         tuple: atoms, M, cutoff
 
     atoms (ase.Atoms):
     ASE atoms object with x,y,z, mass, group, type, cell, and PBCs
-    from input file. group is stored in tag, atom type may not
-    correspond to correct atomic symbol
+    from input file. Velocities (GPUMD units, not ASE velocities) are
+    stored in atoms.arrays['velocities'] and groups in
+    atoms.arrays['groups'], atom type may not correspond to correct
+    atomic symbol
 
     M (int):
     Max number of neighbor atoms
@@ -151,48 +150,50 @@ def load_xyz(filename='xyz.in', atom_types=None):
     cutoff (float):
     Initial cutoff for neighbor list build
     """
-    # read file
+    # read header
     with open(filename) as f:
-        xyz_lines = f.readlines()
+        l1 = tuple(f.readline().split()) # first line
+        l2 = tuple(f.readline().split()) # second line
 
     # get global structure params
-    l1 = tuple(xyz_lines[0].split()) # first line
     N, M, use_triclinic, has_velocity, \
         num_of_groups = [int(val) for val in l1[:2]+l1[3:]]
     cutoff = float(l1[2])
-    l2 = tuple(xyz_lines[1].split()) # second line
-    if use_triclinic:
-        pbc, cell = [int(val) for val in l2[:3]], [float(val) for val in l2[3:]]
-    else:
-        pbc, L = [int(val) for val in l2[:3]], [float(val) for val in l2[3:]]
+    pbc, cell = [int(val) for val in l2[:3]], np.array(l2[3:], dtype=float)
 
     # get atomic params
-    info = dict()
-    atoms = Atoms()
+    xyz = pd.read_csv(filename, sep=r'\s+', skiprows=2, header=None, nrows=N,
+                      dtype=np.float64, engine='c', float_precision='round_trip').to_numpy()
+    atoms = Atoms(numbers=xyz[:, 0].astype(int), positions=xyz[:, 1:4], masses=xyz[:, 4])
     atoms.set_pbc((pbc[0], pbc[1], pbc[2]))
     if use_triclinic:
-        atoms.set_cell(np.array(cell).reshape((3,3)))
+        atoms.set_cell(cell.reshape((3,3)))
     else:
-        atoms.set_cell([(L[0], 0, 0), (0, L[1], 0), (0, 0, L[2])])
-
-    for index, line in enumerate(xyz_lines[2:]):
-        data = dict()
-        lc = tuple(line.split()) # current line
-        type_, mass = int(lc[0]), float(lc[4])
-        position = [float(val) for val in lc[1:4]]
-        atom = Atom(type_, position, mass=mass)
-        lc = lc[5:] # reduce list length for easier indexing
+        atoms.set_cell(np.diag(cell))
+
+    xyz = xyz[:, 5:] # reduce array width for easier indexing
+    if has_velocity:
+        velocities = xyz[:, :3]
+        atoms.new_array('velocities', velocities)
+        xyz = xyz[:, 3:]
+    if num_of_groups:
+        groups = xyz.astype(int)
+        atoms.new_array('groups', groups)
+
+    if legacy_info:
         if has_velocity:
-            velocity = [float(val) for val in lc[:3]]
-            lc = lc[3:]
-            data['velocity'] = velocity
+            velocities = velocities.tolist()
         if num_of_groups:
-            groups = [int(group) for group in lc]
-            data['groups'] = groups
-        atoms.append(atom)
-        info[index] = data
-
-    atoms.info = info
+            groups = groups.tolist()
+        info = dict()
+        for index in range(N):
+            data = dict()
+            if has_velocity:
+                data['velocity'] = velocities[index]
+            if num_of_groups:
+                data['groups'] = groups[index]
+            info[index] = data
+        atoms.info = info
     if atom_types:
         __set_atoms(atoms, atom_types)
 
@@ -219,35 +220,33 @@ def import_trajectory(filename='movie.xyz', in_file=None, atom_types=None):
     """
     # get extra information about system if wanted
     if in_file:
-        atoms, _, _ = load_xyz(in_file,atom_types)
+        atoms, _, _ = load_xyz(in_file, atom_types, legacy_info=False)
         pbc = atoms.get_pbc()
     else:
         pbc = None
 
     with open(filename, 'r') as f:
-        xyz_line = f.readlines()
-
-        num_atoms = int(xyz_line[0])
-        block_size = num_atoms + 2
-        num_blocks = len(xyz_line) // block_size
-        traj = list()
-        for block in range(num_blocks):
-            types = []
-            positions = []
-            ## TODO Loop may be inefficient in accessing xyz_line
-            for entry in xyz_line[block_size*block+2:block_size*(block+1)]:
-                # type_ can be an atom number or index to atom_types
-                type_, x, y, z = entry.split()[:4]
-                positions.append([float(x), float(y), float(z)])
-                if atom_types:
-                    types.append(atom_types[int(type_)])
-                else:
-                    types.append(int(type_))
-            if atom_types:
-                traj.append(Atoms(symbols=types, positions=positions, pbc=pbc))
-            else:
-                traj.append(Atoms(numbers=types, positions=positions, pbc=pbc))
-        return traj
+        num_atoms = int(f.readline())
+    block_size = num_atoms + 2
+    num_blocks = __count_lines(filename) // block_size
+
+    # type_ can be an atom number or index to atom_types (only first frame needed)
+    numbers = pd.read_csv(filename, sep=r'\s+', header=None, usecols=[0], skiprows=2,
+                          nrows=num_atoms, engine='c')[0].to_numpy(dtype=int)
+    if atom_types:
+        numbers = symbols2numbers([atom_types[type_] for type_ in numbers])
+
+    # parse positions of all frames at once, skipping the two header lines of each block as
+    # the comment line is free-form. A single float64 block lets to_numpy return the parsed
+    # data without another copy.
+    header_rows = [block*block_size + k for block in range(num_blocks) for k in (0, 1)]
+    coords = pd.read_csv(filename, sep=r'\s+', header=None, names=[0, 1, 2, 3], usecols=[1, 2, 3],
+                         dtype=np.float64, skiprows=header_rows, nrows=num_blocks*num_atoms,
+                         skip_blank_lines=False, engine='c', float_precision='round_trip').to_numpy()
+    coords = coords.reshape((num_blocks, num_atoms, 3))
+
+    # build each frame directly rather than deep copying a template frame
+    return [Atoms(numbers=numbers, positions=positions, pbc=pbc) for positions in coords]
 
 
 #########################################
@@ -390,46 +389,56 @@ def ase_atoms_to_gpumd(atoms, M, cutoff, gpumd_file='xyz.in', sort_key=None,
 
     """
 
-    info = atoms.info # info dictionary that stores velocities, groups
+    # velocities and groups are taken from the info dictionary if it has them
+    # (assume info[0] has same keys and number of groups as all other indices),
+    # otherwise from the atoms arrays as stored by load_xyz. ASE momenta are
+    # never written as they are not in GPUMD units
+    info = atoms.info
+    infokeys = info[0] if (info and (0 in info)) else dict()
+    N = len(atoms)
+    velocities = None
+    groups = None
+    if 'velocity' in infokeys:
+        velocities = np.array([info[i]['velocity'] for i in range(N)])
+    elif atoms.has('velocities'):
+        velocities = atoms.arrays['velocities']
+    if 'groups' in infokeys:
+        groups = np.array([info[i]['groups'] for i in range(N)], dtype=int)
+        if atoms.has('groups') and groups.shape[1] < atoms.arrays['groups'].shape[1]:
+            raise ValueError('Groups in atoms.info are missing groupings stored in atoms.arrays.')
+    elif atoms.has('groups'):
+        groups = atoms.arrays['groups']
+
     # sort atoms by desired property
     if sort_key == 'type':
-        atoms_list = sorted(atoms, key=lambda x: __atom_type_sortkey(x, order))
+        rank = __get_rank(order) if order else None
+        atoms_list = sorted(atoms, key=lambda x: __atom_type_sortkey(x, rank))
+        index = [atom.index for atom in atoms_list]
     elif sort_key == 'group':
-        atoms_list = sorted(atoms, key=lambda x: __atom_group_sortkey(x, info, group_index, order))
+        rank = __get_rank(order) if order else None
+        sort_groups = None if groups is None else groups[:, group_index]
+        atoms_list = sorted(atoms, key=lambda x: __atom_group_sortkey(x, sort_groups, rank))
+        index = [atom.index for atom in atoms_list]
     else:
-        atoms_list = atoms
+        index = np.arange(N)
 
     # set order of types
+    symbols = atoms.get_chemical_symbols()
     if sort_key=='type' and order:
         types = order
     else:
-        types = list(set(atoms.get_chemical_symbols()))
+        types = list(set(symbols))
 
     type_dict = dict()
     for i, type_ in enumerate(types):
         type_dict[type_] = i
 
-    # assume info[0] has same keys and number of groups as all other indices
-    num_groups = 0
-    if info and (0 in info):
-        infokeys = list(info[0])
-        velocity = 'velocity' in infokeys
-        if 'groups' in infokeys:
-            groups = True
-            num_groups = str(len(info[0]['groups']))
-        else:
-            groups = False
-    else:
-        velocity = 0
-        groups = 0
-
     # prepare cell to write
-    N = len(atoms)
     pbc = [str(1) if val else str(0) for val in atoms.get_pbc()]
     lx, ly, lz, a1, a2, a3 = tuple(atoms.get_cell_lengths_and_angles())
     summary = ' '.join([str(N), str(M), str(cutoff), '@',
-                        '1' if velocity else '0',
-                        num_groups if groups else '0','\n'])
+                        '0' if velocities is None else '1',
+                        '0' if groups is None else str(groups.shape[1]), '\n'])
 
     # if orthorhombic
     if a1 == a2 == a3 == 90:
@@ -441,14 +450,22 @@ def ase_atoms_to_gpumd(atoms, M, cutoff, gpumd_file='xyz.in', sort_key=None,
         cell_str_vec = [str(val) for val in atoms.get_cell().flatten()]
         summary += ' '.join(pbc + cell_str_vec + ['\n'])
 
+    # assemble all atom lines as one array
+    type_index = np.fromiter((type_dict[sym] for sym in symbols), dtype=int, count=N)
+    columns = [type_index[index],
+               atoms.get_positions()[index],
+               atoms.get_masses()[index]]
+    fmt = ['%d'] + ['%.17g'] * 4
+    if velocities is not None:
+        columns.append(velocities[index])
+        fmt += ['%.17g'] * 3
+    if groups is not None:
+        columns.append(groups[index])
+        fmt += ['%d'] * groups.shape[1]
+    lines = np.column_stack(columns)
+
     # write structure
     with open(gpumd_file, 'w') as f:
         f.writelines(summary)
-        for atom in atoms_list[:-1]:
-            line = __get_atom_line(atom, velocity, groups, type_dict, info)
-            f.writelines(line + '\n')
-        # Last line
-        atom = atoms_list[-1]
-        line = __get_atom_line(atom, velocity, groups, type_dict, info)
-        f.writelines(line)
+        np.savetxt(f, lines, fmt=fmt)
     return
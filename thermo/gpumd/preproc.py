@@ -1,5 +1,11 @@
 from .common import __check_list, __check_range
 from numpy import prod
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
 
 __author__ = "Alexander Gabourie"
 __email__ = "gabourie@stanford.edu"
@@ -9,9 +15,9 @@ __email__ = "gabourie@stanford.edu"
 # Structure preprocessing
 #########################################
 
-def __get_group(split, pos, direction):
+def __get_group(split, positions, direction):
     """
-    Gets the group that an atom belongs to based on its position. Only works in
+    Gets the groups that atoms belong to based on their positions. Only works in
     one direction as it is used for NEMD.
 
     Args:
@@ -19,31 +25,59 @@ def __get_group(split, pos, direction):
             List of boundaries. First element should be lower boundary of
             sim. box in specified direction and the last the upper.
 
-        position (float):
-            Position of the atom
+        positions (ndarray):
+            Positions of the atoms, shape (N, 3)
 
         direction (str):
             Which direction the split will work
 
     Returns:
-        int: Group of atom
+        ndarray: Group of each atom, -1 if out of bounds
 
     """
     if direction == 'x':
-        d = pos[0]
+        d = positions[:, 0]
     elif direction == 'y':
-        d = pos[1]
+        d = positions[:, 1]
+    else:
+        d = positions[:, 2]
+    split = np.asarray(split, dtype=float)
+    if njit:
+        groups = np.empty(len(d), dtype=np.int64)
+        __group_kernel(d, split, groups)
     else:
-        d = pos[2]
-    errmsg = 'Out of bounds error: {}'.format(d)
-    for i, val in enumerate(split[:-1]):
-        if i == 0 and d < val:
-            print(errmsg)
-            return -1
-        if val <= d < split[i + 1]:
-            return i
-    print(errmsg)
-    return -1
+        groups = np.searchsorted(split, d, side='right') - 1
+        groups[groups >= len(split) - 1] = -1
+    out_of_bounds = groups < 0
+    for val in d[out_of_bounds]:
+        print('Out of bounds error: {}'.format(val))
+    return groups
+
+
+if njit:
+    @njit(parallel=True, cache=True)
+    def __group_kernel(d, split, groups):
+        """
+        Compiled, multithreaded version of the group search in __get_group. Used
+        when numba is installed.
+
+        Args:
+            d (ndarray):
+                Position of each atom in the split direction
+
+            split (ndarray):
+                Sorted group boundaries
+
+            groups (ndarray):
+                Output array. Group of each atom, -1 if out of bounds
+
+        """
+        num_groups = len(split) - 1
+        for i in prange(d.shape[0]):
+            group = np.searchsorted(split, d[i], side='right') - 1
+            if group >= num_groups:
+                group = -1
+            groups[i] = group
 
 
 def __init_index(index, info, num_atoms):
@@ -66,6 +100,8 @@ def __init_index(index, info, num_atoms):
     """
     if index == num_atoms - 1:
         index = -1
+        if index not in info and num_atoms - 1 in info:
+            info[index] = info[num_atoms - 1]
     if index not in info:
         info[index] = dict()
     return index
@@ -86,6 +122,46 @@ def __handle_end(info, num_atoms):
     info[num_atoms - 1] = info[-1]
 
 
+def __uses_info(atoms, array_name, info_key):
+    """
+    Checks if per-atom data is kept in the info dict. Atoms loaded with
+    load_xyz(..., legacy_info=False) keep it in atoms.arrays instead.
+
+    Args:
+        atoms (ase.Atoms):
+            Atoms to check.
+
+        array_name (str):
+            Name of the data in atoms.arrays.
+
+        info_key (str):
+            Key of the data in each per-atom entry of the info dict.
+
+    Returns:
+        bool: True if the data should be stored in the info dict.
+
+    """
+    info = atoms.info
+    return array_name not in atoms.arrays or (0 in info and info_key in info[0])
+
+
+def __append_groups(atoms, groups):
+    """
+    Adds a grouping as a new column of atoms.arrays['groups']. Works in-place.
+
+    Args:
+        atoms (ase.Atoms):
+            Atoms with a 'groups' array.
+
+        groups (ndarray):
+            Group of each atom.
+
+    """
+    groups = np.column_stack((atoms.arrays['groups'], groups))
+    atoms.set_array('groups', None)
+    atoms.new_array('groups', groups)
+
+
 def add_group_by_position(split, atoms, direction):
     """
     Assigns groups to all atoms based on its position. Only works in
@@ -107,20 +183,22 @@ def add_group_by_position(split, atoms, direction):
         int: A list of number of atoms in each group.
 
     """
-    info = atoms.info
-    counts = [0] * (len(split) - 1)
+    use_info = __uses_info(atoms, 'groups', 'groups')
     num_atoms = len(atoms)
-    for index, atom in enumerate(atoms):
-        index = __init_index(index, info, num_atoms)
-        i = __get_group(split, atom.position, direction)
-        if 'groups' in info[index]:
-            info[index]['groups'].append(i)
-        else:
-            info[index]['groups'] = [i]
-        counts[i] += 1
-    __handle_end(info, num_atoms)
-    atoms.info = info
-    return counts
+    groups = __get_group(split, atoms.get_positions(), direction)
+    if 'groups' in atoms.arrays:
+        __append_groups(atoms, groups)
+    if use_info:
+        info = atoms.info
+        for index, i in enumerate(groups.tolist()):
+            index = __init_index(index, info, num_atoms)
+            if 'groups' in info[index]:
+                info[index]['groups'].append(i)
+            else:
+                info[index]['groups'] = [i]
+        __handle_end(info, num_atoms)
+        atoms.info = info
+    return np.bincount(groups[groups >= 0], minlength=len(split) - 1).tolist()
 
 
 def add_group_by_type(atoms, types):
@@ -151,18 +229,23 @@ def add_group_by_type(atoms, types):
 
     num_groups = len(set([types[sym] for sym in set(all_symbols)]))
     num_atoms = len(atoms)
-    info = atoms.info
+    use_info = __uses_info(atoms, 'groups', 'groups')
+    groups = [types[sym] for sym in atoms.get_chemical_symbols()]
     counts = [0] * num_groups
-    for index, atom in enumerate(atoms):
-        index = __init_index(index, info, num_atoms)
-        group = types[atom.symbol]
+    for group in groups:
         counts[group] += 1
-        if 'groups' in info[index]:
-            info[index]['groups'].append(group)
-        else:
-            info[index]['groups'] = [group]
-    __handle_end(info, num_atoms)
-    atoms.info = info
+    if 'groups' in atoms.arrays:
+        __append_groups(atoms, groups)
+    if use_info:
+        info = atoms.info
+        for index, group in enumerate(groups):
+            index = __init_index(index, info, num_atoms)
+            if 'groups' in info[index]:
+                info[index]['groups'].append(group)
+            else:
+                info[index]['groups'] = [group]
+        __handle_end(info, num_atoms)
+        atoms.info = info
     return counts
 
 
@@ -185,16 +268,22 @@ def set_velocities(atoms, custom=None):
         raise ValueError("No velocities provided.")
 
     num_atoms = len(atoms)
-    info = atoms.info
     if not len(custom) == num_atoms:
         return ValueError('Incorrect number of velocities for number of atoms.')
-    for index, (atom, velocity) in enumerate(zip(atoms, custom)):
+    for velocity in custom:
         if not len(velocity) == 3:
             return ValueError('Three components of velocity not provided.')
-        index = __init_index(index, info, num_atoms)
-        info[index]['velocity'] = velocity
-    __handle_end(info, num_atoms)
-    atoms.info = info
+
+    use_info = __uses_info(atoms, 'velocities', 'velocity')
+    if 'velocities' in atoms.arrays:
+        atoms.set_array('velocities', np.array(custom, dtype=float))
+    if use_info:
+        info = atoms.info
+        for index, velocity in enumerate(custom):
+            index = __init_index(index, info, num_atoms)
+            info[index]['velocity'] = velocity
+        __handle_end(info, num_atoms)
+        atoms.info = info
 
 
 def __init_index2(index, info): # TODO merge this with other __init_index function
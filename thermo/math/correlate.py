@@ -1,6 +1,13 @@
 import pyfftw
 import multiprocessing
 import numpy as np
+import scipy.fft
+from contextlib import nullcontext
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
 
 
 def autocorr(f, max_lag):
@@ -76,3 +83,84 @@ def corr(f, g, max_lag):
     rev()
     cf = cf[:N]/d
     return np.real(cf[:max_lag+1])
+
+
+def corr_batch(F, g, max_lag, backend='numpy', dtype=None, block_size=None):
+    """
+    Computes fast correlation functions <F[m]*g> for every row of F and returns up to max_lag. Rows are transformed
+    in blocks with a batched real FFT. Assumes rows of F and g are same length.
+
+    Args:
+        F (ndarray or list(ndarray)):
+            2D array with one vector for correlation per row. A list of such arrays can be given to correlate all of
+            them with g while transforming g only once
+
+        g (ndarray):
+            Vector for correlation
+
+        max_lag (float):
+            Lag at which to calculate up to
+
+        backend (str):
+            FFT backend, either 'numpy' (host) or 'cupy' (GPU). The 'cupy' backend requires CuPy to be installed
+
+        dtype (type):
+            Floating point precision of the FFTs. Defaults to the precision of the inputs
+
+        block_size (int):
+            Number of rows of F transformed at once, which bounds peak memory for long signals. Defaults to as
+            many rows as fit in about 2^22 padded samples
+
+    Returns:
+        ndarray or list(ndarray): Correlation vectors, one per row of F. A list if F is a list
+
+    """
+    single = not isinstance(F, (list, tuple))
+    if single:
+        F = [F]
+    if not all(f.shape[-1] == len(g) for f in F):
+        raise ValueError('corr_batch arguments must be the same length.')
+    if max_lag >= len(g):
+        raise ValueError('max_lag must be less than the length of the corr_batch arguments.')
+
+    if backend == 'numpy':
+        xp, fft, context = np, scipy.fft, scipy.fft.set_workers(-1)
+    elif backend == 'cupy':
+        if cp is None:
+            raise ImportError("CuPy is required for the 'cupy' backend.")
+        xp, fft, context = cp, cp.fft, nullcontext()
+    else:
+        raise ValueError('Invalid backend used.')
+
+    N = len(g)
+    num_lags = int(max_lag) + 1
+    # zero pad to at least 2N to avoid circular correlation. The length is the same for every
+    # transform so the backend's cached FFT plan is reused
+    n = scipy.fft.next_fast_len(2*N, real=True)
+    if block_size is None:
+        block_size = max(1, 2**22 // n)
+    d = N - np.arange(num_lags)
+    out = list()
+    with context:
+        gvi = fft.rfft(xp.asarray(g, dtype=dtype), n=n)
+        for f in F:
+            rows = f.reshape(-1, N)
+            cf = None
+            for start in range(0, rows.shape[0], block_size):
+                stop = start + block_size
+                fvi = fft.rfft(xp.asarray(rows[start:stop], dtype=dtype), n=n, axis=-1)
+                xp.conjugate(fvi, out=fvi)
+                fvi *= gvi
+                block = fft.irfft(fvi, n=n, axis=-1)[:, :num_lags]
+                del fvi
+                if backend == 'cupy':
+                    block = cp.asnumpy(block)
+                if cf is None:
+                    cf = np.empty((rows.shape[0], num_lags), dtype=block.dtype)
+                    d = d.astype(block.dtype)
+                np.divide(block, d, out=cf[start:stop])
+                del block
+            out.append(cf.reshape(f.shape[:-1] + (num_lags,)))
+    if single:
+        return out[0]
+    return out